@@ -1,8 +1,8 @@
-import os, json, time, requests, pandas as pd
+import os, time, hashlib, requests, orjson, numpy as np, pandas as pd
 import streamlit as st
 from streamlit_folium import st_folium
 import folium
-from folium.plugins import MarkerCluster
+from folium.plugins import FastMarkerCluster
 
 # --------- SETTINGS via Secrets ----------
 MONDAY_TOKEN = os.getenv("MONDAY_TOKEN")
@@ -11,152 +11,267 @@ ORDER_VALUE_COLUMN_TITLE = os.getenv("ORDER_VALUE_TITLE", "Order Value")
 LOCATION_COLUMN_TITLE = os.getenv("LOCATION_TITLE", "Location")
 EXTRA_DETAIL_COLUMNS = [c.strip() for c in os.getenv("DETAIL_TITLES","Customer,Status,Order Date").split(",") if c.strip()]
 AUTO_REFRESH_SECONDS = int(os.getenv("AUTO_REFRESH_SECONDS","60"))
+FULL_RESYNC_SECONDS = int(os.getenv("FULL_RESYNC_SECONDS","3600"))
+PRUNE_SECONDS = int(os.getenv("PRUNE_SECONDS","300"))
 # -----------------------------------------
 
 st.set_page_config(page_title="Orders Map", layout="wide")
 st.title("Orders Map (live from monday.com)")
 st.caption(f"Auto-refresh every {AUTO_REFRESH_SECONDS}s")
 
-def monday(query, variables=None):
-    headers = {"Authorization": MONDAY_TOKEN, "Content-Type": "application/json"}
-    r = requests.post("https://api.monday.com/v2", headers=headers,
-                      json={"query": query, "variables": variables or {}}, timeout=30)
+@st.cache_resource
+def http_session():
+    # Keep-alive connection pool, so pages and reruns skip the TCP/TLS handshake
+    s = requests.Session()
+    s.headers.update({"Content-Type": "application/json"})
+    return s
+
+def monday(api_token, query, variables=None):
+    # orjson on both ends; the token goes on each request, the session only pools connections
+    r = http_session().post("https://api.monday.com/v2", headers={"Authorization": api_token},
+                            data=orjson.dumps({"query": query, "variables": variables or {}}), timeout=30)
     r.raise_for_status()
-    data = r.json()
+    data = orjson.loads(r.content)
     if "errors" in data: raise RuntimeError(data["errors"])
     return data["data"]
 
-# Map column titles -> ids so this works with your names
-cols_resp = monday("""
-query($board_id:[Int]) {
-  boards(ids:$board_id) {
-    columns { id title type }
-  }
-}
-""", {"board_id": int(BOARD_ID)})
-
-title_to_id = {c["title"]: c["id"] for c in cols_resp["boards"][0]["columns"]}
-loc_col_id   = title_to_id.get(LOCATION_COLUMN_TITLE)
-value_col_id = title_to_id.get(ORDER_VALUE_COLUMN_TITLE)
-
-# Pull all items (pagination)
-items = []
-cursor = None
-while True:
-    resp = monday("""
-    query($board_id:[Int], $cursor:String) {
+ITEM_FIELDS = """
+            id name created_at updated_at
+            column_values(ids:$column_ids) {
+              id text
+              ... on LocationValue { lat lng address }
+              ... on NumbersValue { number }
+            }
+"""
+
+def fetch_raw_items(board_id, api_token, column_ids, required_ids=(), since=None, ids_only=False):
+    # Cursor-paginates the board, returning only the `column_ids` column values (or, with `ids_only`,
+    # just each item's id). Monday skips items where any of `required_ids` is empty and, with `since`
+    # (YYYY-MM-DD), items not updated on or after that day.
+    rules = [{"column_id": cid, "compare_value": [], "operator": "is_not_empty"} for cid in required_ids]
+    if since:
+        rules.append({"column_id": "__last_updated__", "compare_attribute": "UPDATED_AT",
+                      "operator": "greater_than_or_equals", "compare_value": ["EXACT", since]})
+    fields, column_var, column_vals = ("id", "", {}) if ids_only else (ITEM_FIELDS, ", $column_ids:[String!]", {"column_ids": list(column_ids)})
+    page = monday(api_token, """
+    query($board_id:[Int], $query_params:ItemsQuery""" + column_var + """) {
       boards(ids:$board_id) {
-        items_page(limit:250, cursor:$cursor) {
+        items_page(limit:500, query_params:$query_params) {
           cursor
-          items {
-            id name updated_at
-            column_values { id title text value }
-          }
+          items {""" + fields + """}
         }
       }
-    }""", {"board_id": int(BOARD_ID), "cursor": cursor})
-    page = resp["boards"][0]["items_page"]
-    items.extend(page["items"])
-    cursor = page["cursor"]
-    if not cursor: break
-
-def parse_location(raw_value, raw_text):
-    # Works for monday JSON and "lat,lng" text
-    if raw_value:
-        try:
-            j = json.loads(raw_value)
-            if isinstance(j, dict) and "lat" in j and "lng" in j:
-                return float(j["lat"]), float(j["lng"]), j.get("address","")
-        except Exception:
-            pass
-    if raw_text and "," in raw_text:
-        try:
-            lat_s, lng_s = raw_text.split(",", 1)
-            return float(lat_s.strip()), float(lng_s.strip()), ""
-        except Exception:
-            pass
-    return None, None, ""
-
-rows = []
-for it in items:
-    vals = {cv["title"]: cv for cv in it["column_values"]}
-    # order value → number
-    val_txt = (vals.get(ORDER_VALUE_COLUMN_TITLE, {}).get("text") or "").replace("$","").replace(",","").strip()
-    try: order_val = float(val_txt) if val_txt else None
-    except: order_val = None
-    # location
-    lat, lng, addr = parse_location(
-        vals.get(LOCATION_COLUMN_TITLE, {}).get("value"),
-        vals.get(LOCATION_COLUMN_TITLE, {}).get("text")
-    )
-    if lat is None or lng is None or order_val is None: continue
-
-    row = {
-        "id": it["id"], "name": it["name"], "updated_at": it["updated_at"],
-        "order_value": order_val, "lat": lat, "lng": lng, "address": addr
+    }""", {"board_id": int(board_id), "query_params": {"rules": rules} if rules else None, **column_vals})["boards"][0]["items_page"]
+    items = page["items"]
+    # built once, only the cursor changes between pages
+    next_query = """
+    query($cursor:String!""" + column_var + """) {
+      next_items_page(limit:500, cursor:$cursor) {
+        cursor
+        items {""" + fields + """}
+      }
+    }"""
+    while page["cursor"]:
+        page = monday(api_token, next_query, {"cursor": page["cursor"], **column_vals})["next_items_page"]
+        items.extend(page["items"])
+    return items
+
+MAX_SNAPSHOTS = 8  # board/column-setting combinations kept in memory across sessions
+
+@st.cache_resource
+def item_snapshots():
+    # (board_id, api_token, column_ids, required_ids) -> {"items": {item_id: item}, "synced_at": epoch seconds, "pruned_at": epoch seconds}
+    return {}
+
+def sync_items(board_id, api_token, column_ids, required_ids):
+    # First call (and every FULL_RESYNC_SECONDS, as a safety net) pulls the whole board. Later calls
+    # pull only items updated since the newest updated_at already seen, merged by id. Every
+    # PRUNE_SECONDS an ids-only listing of the board also drops items deleted since the last one.
+    key = (board_id, api_token, column_ids, required_ids)
+    snaps = item_snapshots()
+    snap = snaps.get(key)
+    now = time.time()
+    if snap is None or not snap["items"] or now - snap["synced_at"] > FULL_RESYNC_SECONDS:
+        snap = {"items": {it["id"]: it for it in fetch_raw_items(board_id, api_token, column_ids, required_ids)}, "synced_at": now, "pruned_at": now}
+    else:
+        # the filter is day-granular and uses the account's timezone, so step back a day
+        watermark = pd.Timestamp(max(it["updated_at"] for it in snap["items"].values()))
+        since = (watermark - pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        # no is_not_empty rule on the delta, so items whose required column was cleared are seen and removed
+        items = dict(snap["items"])
+        for it in fetch_raw_items(board_id, api_token, column_ids, since=since):
+            texts = {cv["id"]: cv.get("text") for cv in it["column_values"]}
+            if all(texts.get(cid) for cid in required_ids):
+                items[it["id"]] = it
+            else:
+                items.pop(it["id"], None)
+        snap = {**snap, "items": items}
+        if now - snap["pruned_at"] > PRUNE_SECONDS:
+            # listed after the delta, so an item created in between is never pruned
+            live = {it["id"] for it in fetch_raw_items(board_id, api_token, column_ids, required_ids, ids_only=True)}
+            snap = {**snap, "items": {i: it for i, it in items.items() if i in live}, "pruned_at": now}
+    # Least recently used last; other sessions' column settings keep their snapshots, up to MAX_SNAPSHOTS
+    snaps.pop(key, None)
+    snaps[key] = snap
+    for k in list(snaps)[:-MAX_SNAPSHOTS]:
+        snaps.pop(k, None)
+    return list(snap["items"].values())
+
+def parse_location(lat, lng, address, raw_text):
+    # Typed LocationValue fields first, "lat,lng" text as fallback; all args are Series over the whole board
+    jlat, jlng = pd.to_numeric(lat, errors="coerce"), pd.to_numeric(lng, errors="coerce")
+    txt = raw_text.astype("string").str.extract(r"^\s*([-\d.]+)\s*,\s*([-\d.]+)").apply(pd.to_numeric, errors="coerce")
+    has_typed = jlat.notna() & jlng.notna()
+    return pd.DataFrame({
+        "lat": jlat.where(has_typed, txt[0]), "lng": jlng.where(has_typed, txt[1]),
+        "address": address.where(has_typed).fillna("")
+    })
+
+@st.cache_data(ttl=AUTO_REFRESH_SECONDS, show_spinner=False)
+def load_rows(board_id, token_hash):
+    # Board → parsed, mappable rows. token_hash only keys the cache (requests use MONDAY_TOKEN)
+
+    # Map column titles -> ids so this works with your names
+    cols_resp = monday(MONDAY_TOKEN, """
+    query($board_id:[Int]) {
+      boards(ids:$board_id) {
+        columns { id title type }
+      }
     }
-    for t in EXTRA_DETAIL_COLUMNS:
-        row[t] = vals.get(t, {}).get("text")
-    rows.append(row)
+    """, {"board_id": int(board_id)})
 
-df = pd.DataFrame(rows)
-if df.empty:
-    st.warning("No mappable rows found (check column titles or data)."); st.stop()
+    title_to_id = {c["title"]: c["id"] for c in cols_resp["boards"][0]["columns"]}
+    loc_col_id   = title_to_id.get(LOCATION_COLUMN_TITLE)
+    value_col_id = title_to_id.get(ORDER_VALUE_COLUMN_TITLE)
+
+    # Only the columns we show are fetched, and only items that have a location and an order value
+    column_ids = tuple(dict.fromkeys(title_to_id[t] for t in [LOCATION_COLUMN_TITLE, ORDER_VALUE_COLUMN_TITLE, *EXTRA_DETAIL_COLUMNS] if t in title_to_id))
+    items = sync_items(board_id, MONDAY_TOKEN, column_ids, tuple(c for c in (loc_col_id, value_col_id) if c))
+
+    # One frame of items, with their column values pivoted wide by column id (monday no longer returns
+    # column_values.title); titles are looked up through title_to_id (last wins on duplicate titles)
+    df = pd.DataFrame(items, columns=["id","name","updated_at"])
+    if not df.empty:
+        fields = ["text", "lat", "lng", "address", "number"]  # typed fields only exist on their column types
+        cvs = pd.json_normalize(items, record_path="column_values", meta=["id"], meta_prefix="item_")
+        cvs = cvs.reindex(columns=["item_id", "id", *fields])
+        wide = (cvs.pivot(index="item_id", columns="id", values=fields)
+                .reindex(index=df["id"], columns=pd.MultiIndex.from_product([fields, column_ids])).set_axis(df.index))
+        # a title missing from the board (or a column no item has set) is float NaN, hence the string casts
+        missing = pd.Series(np.nan, index=df.index)
+        col = lambda f, t: wide[(f, title_to_id[t])] if t in title_to_id else missing
+        # order value → number (numbers columns come typed; text columns are parsed), location → lat/lng/address
+        order_text = col("text", ORDER_VALUE_COLUMN_TITLE).astype("string").str.replace(r"[$,]", "", regex=True).str.strip().pipe(pd.to_numeric, errors="coerce")
+        df["order_value"] = pd.to_numeric(col("number", ORDER_VALUE_COLUMN_TITLE), errors="coerce").astype("float64").fillna(order_text.astype("float64"))
+        df[["lat","lng","address"]] = parse_location(*(col(f, LOCATION_COLUMN_TITLE) for f in ("lat", "lng", "address", "text")))
+        for t in EXTRA_DETAIL_COLUMNS:
+            df[t] = col("text", t)
+        df = df.dropna(subset=["order_value","lat","lng"])
+        # float32 keeps ~1 m precision on lat/lng; whole-dollar values fit int32
+        df = df.astype({"lat": "float32", "lng": "float32"})
+        if not df.empty and df["order_value"].eq(df["order_value"].round()).all() and df["order_value"].abs().max() < 2**31:
+            df["order_value"] = df["order_value"].astype("int32")
+        # Lowercased search haystack, built once per fetch instead of on every keystroke
+        text_of = lambda c: df[c].fillna("").astype(str)
+        df["_search"] = text_of("name").str.cat([text_of(t) for t in EXTRA_DETAIL_COLUMNS], sep="\n").str.lower()
+    return df
+
+def unit_xyz(lats, lngs):
+    # Points on the unit sphere: the nearest marker by great-circle distance is the one with the
+    # largest dot product, with no special cases at the antimeridian or the poles
+    phi, lam = np.radians(np.asarray(lats, dtype="float64")), np.radians(np.asarray(lngs, dtype="float64"))
+    return np.column_stack([np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)])
+
+def nearest_idx(xyz, lat0, lng0):
+    # Position of the row in `xyz` closest to (lat0, lng0)
+    return int(np.argmax(xyz @ unit_xyz([lat0], [lng0])[0]))
+
+# Markers are created in the browser from plain [lat, lng, popup, tooltip] rows
+MARKER_CALLBACK = """function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {radius: 6, weight: 1, fill: true, fillOpacity: 0.85});
+    marker.bindPopup(row[2], {maxWidth: 320});
+    marker.bindTooltip(row[3]);
+    return marker;
+}"""
 
-# Filters
-left, mid, right = st.columns([2,1,2])
-with left:
-    lo, hi = int(df["order_value"].min()), int(df["order_value"].max())
-    vmin, vmax = st.slider("Order value range", lo, hi, (lo, hi), step=1)
-with mid:
-    st.write("")
-    if st.button("Refresh now"): st.rerun()
-with right:
-    q = st.text_input("Search name/customer (optional)", "")
-
-mask = (df["order_value"]>=vmin) & (df["order_value"]<=vmax)
-if q:
-    ql = q.lower()
-    mask &= df.apply(lambda r: ql in str(r["name"]).lower() or any(ql in str(r.get(t,"")).lower() for t in EXTRA_DETAIL_COLUMNS), axis=1)
-filtered = df[mask].copy()
-
-# Map
-m = folium.Map(location=[filtered["lat"].mean(), filtered["lng"].mean()], zoom_start=4, tiles="OpenStreetMap")
-cluster = MarkerCluster().add_to(m)
 fmt = lambda x: "${:,.0f}".format(float(x)) if x not in (None,"") else "—"
 
-for _, r in filtered.iterrows():
-    html = f"<b>{r['name']}</b><br>Value: {fmt(r['order_value'])}<br>Address: {r.get('address') or '—'}"
+def marker_rows(filtered):
+    # [lat, lng, popup, tooltip] per marker, with popup/tooltip HTML for all markers at once
+    values = filtered["order_value"].map(fmt)
+    html = "<b>" + filtered["name"].astype(str) + "</b><br>Value: " + values + "<br>Address: " + filtered["address"].replace("", "—")
     for t in EXTRA_DETAIL_COLUMNS:
-        v = r.get(t);  html += f"<br>{t}: {v}" if v else ""
-    html += f"<br><a href='https://view.monday.com/boards/{BOARD_ID}/pulses/{r['id']}' target='_blank'>Open in monday</a>"
-    folium.CircleMarker(
-        location=[r["lat"], r["lng"]], radius=6, weight=1, fill=True, fill_opacity=0.85,
-        popup=folium.Popup(html, max_width=320),
-        tooltip=f"{r['name']} • {fmt(r['order_value'])}"
-    ).add_to(cluster)
-
-out = st_folium(m, width=1100, height=600)
-
-# Details panel
-st.markdown("### Selected order")
-selected = None
-if out and out.get("last_object_clicked"):
-    latc = round(out["last_object_clicked"]["lat"], 5)
-    lngc = round(out["last_object_clicked"]["lng"], 5)
-    filtered["dist"] = (filtered["lat"].round(5).sub(latc).abs() + filtered["lng"].round(5).sub(lngc).abs())
-    selected = filtered.nsmallest(1, "dist").drop(columns=["dist"]).to_dict("records")[0]
-if selected:
-    details = {
-        "Name": selected["name"],
-        "Order Value": fmt(selected["order_value"]),
-        "Address": selected.get("address"),
-        **{t: selected.get(t) for t in EXTRA_DETAIL_COLUMNS},
-        "monday link": f"https://view.monday.com/boards/{BOARD_ID}/pulses/{selected['id']}"
-    }
-    st.write(details)
-else:
-    st.info("Click a marker to see full details here.")
+        v = filtered[t].fillna("").astype(str)
+        html += ("<br>" + t + ": " + v).where(v != "", "")
+    html += f"<br><a href='https://view.monday.com/boards/{BOARD_ID}/pulses/" + filtered["id"].astype(str) + "' target='_blank'>Open in monday</a>"
+    tooltips = filtered["name"].astype(str) + " • " + values
+    lats, lngs = (filtered[c].to_numpy("float64").round(5).tolist() for c in ("lat", "lng"))
+    return list(zip(lats, lngs, html.tolist(), tooltips.tolist()))
+
+def build_map(rows, center):
+    # A new Map every run: st_folium changes the Map it renders, and a re-rendered Map gets a new widget key
+    m = folium.Map(location=center, zoom_start=4, tiles="OpenStreetMap")
+    FastMarkerCluster(rows, callback=MARKER_CALLBACK).add_to(m)
+    return m
+
+def frame_key(df):
+    # Cheap content hash of a frame (values + index)
+    return hashlib.blake2b(pd.util.hash_pandas_object(df).values.tobytes(), digest_size=8).digest()
+
+@st.fragment
+def filter_ui(df):
+    # Filters, map and details rerun on their own; the cached board data is untouched
+    left, mid, right = st.columns([2,1,2])
+    with left:
+        lo, hi = int(df["order_value"].min()), int(df["order_value"].max())
+        vmin, vmax = st.slider("Order value range", lo, hi, (lo, hi), step=1)
+    with mid:
+        st.write("")
+        if st.button("Refresh now"):
+            item_snapshots().clear(); st.cache_data.clear(); st.rerun()
+    with right:
+        q = st.text_input("Search name/customer (optional)", "")
+
+    mask = (df["order_value"]>=vmin) & (df["order_value"]<=vmax)
+    if q:
+        mask &= df["_search"].str.contains(q.lower(), regex=False)
+    filtered = df.loc[mask]
+
+    # Marker rows and click-lookup coordinates (rebuilt only when the filtered rows actually change)
+    map_key = frame_key(filtered)
+    if st.session_state.get("map_key") != map_key:
+        st.session_state["map_rows"] = marker_rows(filtered)
+        st.session_state["map_center"] = [float(filtered["lat"].mean()), float(filtered["lng"].mean())]
+        st.session_state["map_xyz"] = unit_xyz(filtered["lat"], filtered["lng"])
+        st.session_state["map_key"] = map_key
+    # Only a marker click is sent back, so panning or zooming the map does not rerun the fragment
+    m = build_map(st.session_state["map_rows"], st.session_state["map_center"])
+    out = st_folium(m, width=1100, height=600, returned_objects=["last_object_clicked"])
+
+    # Details panel
+    st.markdown("### Selected order")
+    selected = None
+    if out and out.get("last_object_clicked"):
+        click = out["last_object_clicked"]
+        i = nearest_idx(st.session_state["map_xyz"], click["lat"], click["lng"])
+        selected = filtered.iloc[i].to_dict()
+    if selected:
+        details = {
+            "Name": selected["name"],
+            "Order Value": fmt(selected["order_value"]),
+            "Address": selected.get("address"),
+            **{t: selected.get(t) for t in EXTRA_DETAIL_COLUMNS},
+            "monday link": f"https://view.monday.com/boards/{BOARD_ID}/pulses/{selected['id']}"
+        }
+        st.write(details)
+    else:
+        st.info("Click a marker to see full details here.")
+
+df = load_rows(BOARD_ID, hashlib.sha256((MONDAY_TOKEN or "").encode()).hexdigest())
+if df.empty:
+    st.warning("No mappable rows found (check column titles or data)."); st.stop()
+
+filter_ui(df)
 
 # Light auto-refresh (keeps UX simple on Streamlit Cloud)
 st.caption("Tip: use the Refresh button above if needed.")
@@ -1,9 +1,10 @@
 
-import os, json, requests, pandas as pd, streamlit as st
+import os, time, hashlib, requests, orjson, numpy as np, pandas as pd, streamlit as st
 from datetime import datetime, date
 from streamlit_folium import st_folium
 import folium
-from folium.plugins import MarkerCluster
+import pyarrow as pa, pyarrow.compute as pc, pyarrow.csv as pacsv, pyarrow.parquet as pq
+from folium.plugins import FastMarkerCluster
 
 st.set_page_config(page_title="Orders Map (Monday.com)", layout="wide")
 
@@ -11,6 +12,10 @@ st.set_page_config(page_title="Orders Map (Monday.com)", layout="wide")
 API_TOKEN = st.secrets.get("MONDAY_API_TOKEN", os.getenv("MONDAY_API_TOKEN", ""))
 BOARD_ID = st.secrets.get("MONDAY_BOARD_ID", os.getenv("MONDAY_BOARD_ID", ""))
 SUBDOMAIN = st.secrets.get("MONDAY_SUBDOMAIN", os.getenv("MONDAY_SUBDOMAIN", ""))  # youraccount.monday.com (only the subdomain part)
+# full re-pull interval, a safety net against missed updates
+FULL_RESYNC_SECONDS = int(st.secrets.get("FULL_RESYNC_SECONDS", os.getenv("FULL_RESYNC_SECONDS", "3600")))
+# how often an ids-only listing of the board drops deleted items (each refresh only fetches changes)
+PRUNE_SECONDS = int(st.secrets.get("PRUNE_SECONDS", os.getenv("PRUNE_SECONDS", "300")))
 
 if not API_TOKEN or not BOARD_ID:
     st.warning("Add MONDAY_API_TOKEN and MONDAY_BOARD_ID in Streamlit secrets (or as env vars) to load live data. Showing an empty app until secrets are set.")
@@ -30,137 +35,182 @@ with st.sidebar:
     country_col = st.text_input("Country column ID (optional)", value="country")
     extra_cols_str = st.text_input("Other column IDs (comma-separated, optional)", value="")
     cluster_markers = st.toggle("Cluster markers", value=True)
+    mappable_only = st.toggle("Only load items with a location", value=False,
+                              help="Filters on Monday's side, so items without a location are never downloaded.")
     st.markdown("---")
     st.caption("Tip: The Monday 'Location' column can be used directly; this app will parse lat/lng from it.")
 
-def _cv_to_dict(cv):
-    # Monday returns {"id": "...", "text": "...", "value": "{...json...} or None"}
-    if not isinstance(cv, dict): 
-        return {"id": None, "text": None, "value": None}
-    out = {"id": cv.get("id"), "text": cv.get("text"), "value": None}
-    try:
-        if cv.get("value"):
-            out["value"] = json.loads(cv["value"])
-    except Exception:
-        out["value"] = cv.get("value")
-    return out
-
-def parse_location(value_obj, text_fallback):
-    # Handles Monday Location column (lat/lng stored in JSON) or "lat, lng" text
-    if isinstance(value_obj, dict) and "lat" in value_obj and "lng" in value_obj:
-        return value_obj.get("lat"), value_obj.get("lng"), value_obj.get("address")
-    if text_fallback and "," in text_fallback:
-        try:
-            lat, lng = [float(x.strip()) for x in text_fallback.split(",")[:2]]
-            return lat, lng, None
-        except Exception:
-            return None, None, None
-    return None, None, None
+def parse_location(lat, lng, address, raw_text):
+    # Handles Monday Location column (typed LocationValue lat/lng) or "lat, lng" text.
+    # All arguments are Series covering every fetched item.
+    typed_lat = pd.to_numeric(lat, errors="coerce")
+    typed_lng = pd.to_numeric(lng, errors="coerce")
+    has_typed = typed_lat.notna() & typed_lng.notna()
+    text_ll = raw_text.str.extract(r"^\s*([-\d.]+)\s*,\s*([-\d.]+)").apply(pd.to_numeric, errors="coerce")
+    return pd.DataFrame({
+        "lat": typed_lat.where(has_typed, text_ll[0]),
+        "lng": typed_lng.where(has_typed, text_ll[1]),
+        "address": address.where(has_typed, None)
+    })
+
+@st.cache_resource
+def http_session():
+    # Keep-alive connection pool, so pages and reruns skip the TCP/TLS handshake
+    s = requests.Session()
+    s.headers.update({"Content-Type": "application/json"})
+    return s
+
+def monday(api_token, query, variables=None):
+    # orjson on both ends; the token goes on each request, the session only pools connections
+    r = http_session().post("https://api.monday.com/v2", headers={"Authorization": api_token},
+                            data=orjson.dumps({"query": query, "variables": variables or {}}), timeout=30)
+    r.raise_for_status()
+    data = orjson.loads(r.content)
+    if "errors" in data: raise RuntimeError(data["errors"])
+    return data["data"]
+
+ITEM_FIELDS = """
+            id name created_at updated_at
+            column_values(ids:$column_ids) {
+              id text
+              ... on LocationValue { lat lng address }
+              ... on NumbersValue { number }
+            }
+"""
+
+def fetch_raw_items(board_id, api_token, column_ids, required_ids=(), since=None, ids_only=False):
+    # Cursor-paginates the board, returning only the `column_ids` column values (or, with `ids_only`,
+    # just each item's id). Monday skips items where any of `required_ids` is empty and, with `since`
+    # (YYYY-MM-DD), items not updated on or after that day.
+    rules = [{"column_id": cid, "compare_value": [], "operator": "is_not_empty"} for cid in required_ids]
+    if since:
+        rules.append({"column_id": "__last_updated__", "compare_attribute": "UPDATED_AT",
+                      "operator": "greater_than_or_equals", "compare_value": ["EXACT", since]})
+    fields, column_var, column_vals = ("id", "", {}) if ids_only else (ITEM_FIELDS, ", $column_ids:[String!]", {"column_ids": list(column_ids)})
+    page = monday(api_token, """
+    query($board_id:[Int], $query_params:ItemsQuery""" + column_var + """) {
+      boards(ids:$board_id) {
+        items_page(limit:500, query_params:$query_params) {
+          cursor
+          items {""" + fields + """}
+        }
+      }
+    }""", {"board_id": int(board_id), "query_params": {"rules": rules} if rules else None, **column_vals})["boards"][0]["items_page"]
+    items = page["items"]
+    # built once, only the cursor changes between pages
+    next_query = """
+    query($cursor:String!""" + column_var + """) {
+      next_items_page(limit:500, cursor:$cursor) {
+        cursor
+        items {""" + fields + """}
+      }
+    }"""
+    while page["cursor"]:
+        page = monday(api_token, next_query, {"cursor": page["cursor"], **column_vals})["next_items_page"]
+        items.extend(page["items"])
+    return items
+
+MAX_SNAPSHOTS = 8  # board/column-setting combinations kept in memory across sessions
+
+@st.cache_resource
+def item_snapshots():
+    # (board_id, api_token, column_ids, required_ids) -> {"items": {item_id: item}, "synced_at": epoch seconds, "pruned_at": epoch seconds}
+    return {}
+
+def sync_items(board_id, api_token, column_ids, required_ids):
+    # First call (and every FULL_RESYNC_SECONDS, as a safety net) pulls the whole board. Later calls
+    # pull only items updated since the newest updated_at already seen, merged by id. Every
+    # PRUNE_SECONDS an ids-only listing of the board also drops items deleted since the last one.
+    key = (board_id, api_token, column_ids, required_ids)
+    snaps = item_snapshots()
+    snap = snaps.get(key)
+    now = time.time()
+    if snap is None or not snap["items"] or now - snap["synced_at"] > FULL_RESYNC_SECONDS:
+        snap = {"items": {it["id"]: it for it in fetch_raw_items(board_id, api_token, column_ids, required_ids)}, "synced_at": now, "pruned_at": now}
+    else:
+        # the filter is day-granular and uses the account's timezone, so step back a day
+        watermark = pd.Timestamp(max(it["updated_at"] for it in snap["items"].values()))
+        since = (watermark - pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        # no is_not_empty rule on the delta, so items whose required column was cleared are seen and removed
+        items = dict(snap["items"])
+        for it in fetch_raw_items(board_id, api_token, column_ids, since=since):
+            texts = {cv["id"]: cv.get("text") for cv in it["column_values"]}
+            if all(texts.get(cid) for cid in required_ids):
+                items[it["id"]] = it
+            else:
+                items.pop(it["id"], None)
+        snap = {**snap, "items": items}
+        if now - snap["pruned_at"] > PRUNE_SECONDS:
+            # listed after the delta, so an item created in between is never pruned
+            live = {it["id"] for it in fetch_raw_items(board_id, api_token, column_ids, required_ids, ids_only=True)}
+            snap = {**snap, "items": {i: it for i, it in items.items() if i in live}, "pruned_at": now}
+    # Least recently used last; other sessions' column settings keep their snapshots, up to MAX_SNAPSHOTS
+    snaps.pop(key, None)
+    snaps[key] = snap
+    for k in list(snaps)[:-MAX_SNAPSHOTS]:
+        snaps.pop(k, None)
+    return list(snap["items"].values())
 
 @st.cache_data(ttl=60, show_spinner=False)
-def fetch_items(board_id, api_token, wanted_ids):
+def fetch_items(board_id, api_token, wanted_ids, mappable_only=False):
     if not api_token or not board_id:
         return pd.DataFrame()
 
-    headers = {
-        "Authorization": api_token,
-        "Content-Type": "application/json"
-    }
-    url = "https://api.monday.com/v2"
-    cursor = None
-    rows = []
-
-    while True:
-        query = """
-        query($board_id: [Int], $cursor: String) {
-          boards (ids: $board_id) {
-            items_page (limit: 500, cursor: $cursor) {
-              cursor
-              items {
-                id
-                name
-                created_at
-                updated_at
-                column_values {
-                  id
-                  text
-                  value
-                }
-              }
-            }
-          }
-        }
-        """
-        variables = {"board_id": int(board_id), "cursor": cursor}
-        resp = requests.post(url, headers=headers, json={"query": query, "variables": variables})
-        resp.raise_for_status()
-        data = resp.json()
-        items_page = data["data"]["boards"][0]["items_page"]
-        items = items_page["items"]
-        cursor = items_page["cursor"]
-
-        for it in items:
-            cv_map = {cv["id"]: _cv_to_dict(cv) for cv in it["column_values"]}
-            # parse location
-            loc_cv = cv_map.get(wanted_ids["location"], {"text": None, "value": None})
-            lat, lng, address = parse_location(loc_cv.get("value"), loc_cv.get("text"))
-
-            def get_text(cid):
-                if cid in cv_map:
-                    return cv_map[cid].get("text")
-                return None
-
-            def get_raw_value(cid):
-                if cid in cv_map:
-                    return cv_map[cid].get("value")
-                return None
-
-            row = {
-                "item_id": it["id"],
-                "name": it["name"],
-                "created_at": it["created_at"],
-                "updated_at": it["updated_at"],
-                "lat": lat,
-                "lng": lng,
-                "address": address,
-                "order_value": None,
-                "status": None,
-                "date": None,
-                "customer": None,
-                "city": None,
-                "state": None,
-                "country": None
-            }
-            # texts
-            row["order_value"] = get_text(wanted_ids["value"])
-            row["status"] = get_text(wanted_ids["status"]) if wanted_ids["status"] else None
-            row["date"] = get_text(wanted_ids["date"]) if wanted_ids["date"] else None
-            row["customer"] = get_text(wanted_ids["customer"]) if wanted_ids["customer"] else None
-            row["city"] = get_text(wanted_ids["city"]) if wanted_ids["city"] else None
-            row["state"] = get_text(wanted_ids["state"]) if wanted_ids["state"] else None
-            row["country"] = get_text(wanted_ids["country"]) if wanted_ids["country"] else None
-
-            # extras
-            for ec in wanted_ids.get("extras", []):
-                row[f"extra__{ec}"] = get_text(ec)
-
-            rows.append(row)
-
-        if not cursor:
-            break
-
-    df = pd.DataFrame(rows)
-    # convert order value numeric if possible
+    # only download the columns we use (and, optionally, only located items)
+    column_ids = tuple(dict.fromkeys(
+        [cid for key, cid in wanted_ids.items() if key != "extras" and cid] + wanted_ids.get("extras", [])
+    ))
+    required_ids = (wanted_ids["location"],) if mappable_only and wanted_ids["location"] else ()
+
+    items = sync_items(board_id, api_token, column_ids, required_ids)
+    df = pd.DataFrame(items, columns=["id", "name", "created_at", "updated_at"]).rename(columns={"id": "item_id"})
+    if df.empty:
+        return df
+
+    # column values pivoted wide by column id, one row per item; typed fields only exist on their column types
+    fields = ["text", "lat", "lng", "address", "number"]
+    cvs = pd.json_normalize(items, record_path="column_values", meta=["id"], meta_prefix="item_")
+    wide = (cvs.reindex(columns=["item_id", "id", *fields]).pivot(index="item_id", columns="id", values=fields)
+            .reindex(index=df["item_id"]).set_axis(df.index))
+    col = lambda f, cid: wide[(f, cid)] if (f, cid) in wide else pd.Series(None, index=df.index, dtype=object)
+
+    loc_parts = [col(f, wanted_ids["location"]) for f in ("lat", "lng", "address", "text")]
+    value_number = col("number", wanted_ids["value"])
+    for key in ("order_value", "status", "date", "customer", "city", "state", "country"):
+        df[key] = col("text", wanted_ids["value" if key == "order_value" else key])
+    for ec in wanted_ids.get("extras", []):
+        df[f"extra__{ec}"] = col("text", ec)
+
+    # parse location
+    loc = parse_location(*loc_parts)
+    df.insert(4, "lat", loc["lat"])
+    df.insert(5, "lng", loc["lng"])
+    df.insert(6, "address", loc["address"])
+
+    # convert order value numeric if possible (Numbers columns arrive typed; text is parsed)
+    value_number = pd.to_numeric(value_number, errors="coerce")
     if "order_value" in df.columns:
-        df["order_value_num"] = pd.to_numeric(df["order_value"].str.replace(",","").str.extract(r'([\d\.]+)')[0], errors="coerce")
+        df["order_value_num"] = value_number.fillna(
+            pd.to_numeric(df["order_value"].str.replace(",","").str.extract(r'([\d\.]+)')[0], errors="coerce").astype("float64"))
     else:
         df["order_value_num"] = None
 
+    # narrower dtypes: float32 keeps ~1 m precision on lat/lng, whole-dollar values fit int32
+    df = df.astype({"lat": "float32", "lng": "float32"})
+    ov = df["order_value_num"]
+    if ov.notna().all() and ov.eq(ov.round()).all() and ov.abs().max() < 2**31:
+        df["order_value_num"] = ov.astype("int32")
+
     # parse date if present
     if "date" in df.columns and df["date"].notna().any():
-        df["date_parsed"] = pd.to_datetime(df["date"], errors="coerce").dt.date
+        df["date_parsed"] = pd.to_datetime(df["date"], errors="coerce")
     else:
-        df["date_parsed"] = None
+        df["date_parsed"] = pd.NaT
+
+    # computed once per fetch: lowercased search text and a categorical (integer-coded) status
+    text_of = lambda c: df[c].fillna("").astype(str)
+    df["_search"] = text_of("customer").str.cat([text_of("name"), text_of("city")], sep="\n").str.lower()
+    df["status"] = df["status"].astype("category")
 
     return df
 
@@ -176,7 +226,7 @@ wanted_ids = {
     "extras": [c.strip() for c in (extra_cols_str.split(",") if extra_cols_str else []) if c.strip()]
 }
 
-df = fetch_items(BOARD_ID, API_TOKEN, wanted_ids)
+df = fetch_items(BOARD_ID, API_TOKEN, wanted_ids, mappable_only)
 
 st.title("📍 Orders Map (from Monday.com)")
 st.caption("Filter by order value, status, and date. Click any marker to see order details.")
@@ -205,14 +255,14 @@ with st.expander("Filters", expanded=True):
         c1.write("Order value not set or non-numeric.")
 
     # Status multiselect
-    status_options = sorted([s for s in df["status"].dropna().unique().tolist()]) if "status" in df.columns else []
+    status_options = df["status"].cat.categories.tolist() if "status" in df.columns else []
     status_sel = c2.multiselect("Status", options=status_options, default=status_options)
 
     # Date range
     if "date_parsed" in df.columns and df["date_parsed"].notna().any():
         mind = df["date_parsed"].min()
         maxd = df["date_parsed"].max()
-        date_range = c3.date_input("Date range", value=(mind, maxd))
+        date_range = c3.date_input("Date range", value=(mind.date(), maxd.date()))
     else:
         date_range = None
         c3.write("No valid date column.")
@@ -222,71 +272,141 @@ with st.expander("Filters", expanded=True):
 
 # Apply filters
 def apply_filters(df):
-    out = df.copy()
-    if "order_value_num" in out.columns:
-        out = out[(out["order_value_num"].fillna(0) >= val_range[0]) & (out["order_value_num"].fillna(0) <= val_range[1])]
-    if "status" in out.columns and status_options:
+    # One combined boolean mask and a single row selection, no intermediate copies
+    mask = pd.Series(True, index=df.index)
+    if "order_value_num" in df.columns:
+        mask &= df["order_value_num"].fillna(0).between(*val_range)
+    if "status" in df.columns and status_options:
         if status_sel:
-            out = out[out["status"].isin(status_sel)]
-    if date_range and isinstance(date_range, (list, tuple)) and len(date_range) == 2 and out["date_parsed"].notna().any():
-        start, end = date_range
-        out = out[(out["date_parsed"] >= start) & (out["date_parsed"] <= end)]
-    if q:
-        mask = (
-            out.get("customer","").astype(str).str.lower().str.contains(q) |
-            out.get("name","").astype(str).str.lower().str.contains(q) |
-            out.get("city","").astype(str).str.lower().str.contains(q)
-        )
-        out = out[mask]
-    return out
+            mask &= df["status"].isin(status_sel)
+    if date_range and isinstance(date_range, (list, tuple)) and len(date_range) == 2 and df["date_parsed"].notna().any():
+        # Timestamp bounds keep the comparison on datetime64; end is exclusive next midnight
+        start = pd.Timestamp(date_range[0])
+        end = pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)
+        mask &= (df["date_parsed"] >= start) & (df["date_parsed"] < end)
+    if q and "_search" in df.columns:
+        mask &= df["_search"].str.contains(q, regex=False)
+    return df.loc[mask]
 
 fdf = apply_filters(df)
 
 # --- Map ---
-if fdf.empty or fdf["lat"].isna().all():
-    st.info("No items with valid latitude/longitude yet.")
-else:
-    lat0 = fdf["lat"].dropna().mean()
-    lng0 = fdf["lng"].dropna().mean()
-    m = folium.Map(location=[lat0, lng0], tiles="cartodbpositron", zoom_start=4)
-    marker_group = MarkerCluster() if cluster_markers else folium.FeatureGroup(name="Orders")
+# JS marker factory for FastMarkerCluster; each row is [lat, lng, popup_html, tooltip]
+MARKER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindPopup(row[2], {maxWidth: 350});
+    marker.bindTooltip(row[3]);
+    return marker;
+}
+"""
+
+# Popup status colours (Monday's default palette) for whole labels, so "Incomplete" or "Unpaid" stay grey
+STATUS_COLORS = [
+    ({"done", "complete", "completed", "delivered", "shipped", "paid"}, "#00c875"),
+    ({"stuck", "cancelled", "canceled", "failed", "lost"}, "#e2445c"),
+    ({"working on it", "in progress", "pending", "on hold"}, "#fdab3d"),
+]
+
+def popup_html(df):
+    # Popup HTML for every row at once; empty fields are left out
+    def line(label, col):
+        v = df[col].astype("string").fillna("")
+        return ("<br>" + label + v).where(v != "", "")
+
+    city, state = df["city"].astype("string").fillna(""), df["state"].astype("string").fillna("")
+    html = "<b>" + df["name"].astype("string").fillna("") + "</b>"
+    html += line("Customer: ", "customer")
+    html += line("Order Value: ", "order_value")
+    status = df["status"].astype("string").fillna("")
+    status_lc = status.str.strip().str.lower()
+    # a Series, not the bare ndarray: str + <U ndarray only works on numpy 2
+    color = pd.Series(np.select([status_lc.isin(labels) for labels, _ in STATUS_COLORS], [c for _, c in STATUS_COLORS], default="#676879"), index=df.index)
+    html += ("<br>Status: <span style='color:" + color + "'>" + status + "</span>").where(status != "", "")
+    html += line("Date: ", "date")
+    html += ("<br>Location: " + city + ", " + state).where((city != "") | (state != ""), "")
+    html += line("Address: ", "address")
+    if SUBDOMAIN:
+        html += f"<br><a target='_blank' href='https://{SUBDOMAIN}.monday.com/boards/{BOARD_ID}/pulses/" + df["item_id"].astype(str) + "'>Open in Monday</a>"
+    return html
+
+def marker_rows(fdf):
+    # [lat, lng, popup_html, tooltip] for every located row
+    points = fdf.dropna(subset=["lat","lng"])
+    popups = popup_html(points).tolist()
+    tooltips = points["name"].fillna("Order").astype(str).tolist()
+    # back to float64 and 5 decimals, so float32 noise doesn't bloat the map payload
+    lats, lngs = (points[c].to_numpy("float64").round(5).tolist() for c in ("lat", "lng"))
+    return list(zip(lats, lngs, popups, tooltips))
+
+def build_map(rows, center, cluster_markers):
+    # Built fresh on every run from cached rows: st_folium changes the Map it renders,
+    # so rendering a stored Map again would give it a new widget key and remount it
+    m = folium.Map(location=center, tiles="cartodbpositron", zoom_start=4)
     if cluster_markers:
-        m.add_child(marker_group)
+        # Clustered markers are built in the browser from plain rows
+        marker_group = FastMarkerCluster(rows, callback=MARKER_CALLBACK)
     else:
-        m.add_child(marker_group)
-
-    def popup_html(row):
-        url = f"https://{SUBDOMAIN}.monday.com/boards/{BOARD_ID}/pulses/{row['item_id']}" if SUBDOMAIN else None
-        parts = []
-        parts.append(f"<b>{row.get('name','')}</b>")
-        if row.get('customer'):
-            parts.append(f"Customer: {row['customer']}")
-        if row.get('order_value'):
-            parts.append(f"Order Value: {row['order_value']}")
-        if row.get('status'):
-            parts.append(f"Status: {row['status']}")
-        if row.get('date'):
-            parts.append(f"Date: {row['date']}")
-        if row.get('city') or row.get('state'):
-            parts.append(f"Location: {row.get('city','')}, {row.get('state','')}")
-        if row.get('address'):
-            parts.append(f"Address: {row['address']}")
-        if url:
-            parts.append(f"<a target='_blank' href='{url}'>Open in Monday</a>")
-        return "<br>".join(parts)
-
-    for _, r in fdf.dropna(subset=["lat","lng"]).iterrows():
-        folium.Marker(
-            location=[r["lat"], r["lng"]],
-            popup=folium.Popup(popup_html(r), max_width=350),
-            tooltip=r.get("name","Order")
-        ).add_to(marker_group)
+        marker_group = folium.FeatureGroup(name="Orders")
+        for lat, lng, popup, tooltip in rows:
+            folium.Marker(
+                location=[lat, lng],
+                popup=folium.Popup(popup, max_width=350),
+                tooltip=tooltip
+            ).add_to(marker_group)
+    m.add_child(marker_group)
+    return m
+
+def frame_key(df, *extra):
+    # Cheap content hash of a frame (values + index) plus any other inputs that shape the output
+    h = hashlib.blake2b(pd.util.hash_pandas_object(df).values.tobytes(), digest_size=8)
+    h.update(repr(extra).encode("utf-8"))
+    return h.digest()
 
+if fdf.empty or fdf["lat"].isna().all():
+    st.info("No items with valid latitude/longitude yet.")
+else:
+    # Reruns that leave the filtered rows unchanged reuse the previously built marker rows
+    map_key = frame_key(fdf)
+    if st.session_state.get("map_key") != map_key:
+        st.session_state["map_rows"] = marker_rows(fdf)
+        st.session_state["map_center"] = [float(fdf["lat"].dropna().mean()), float(fdf["lng"].dropna().mean())]
+        st.session_state["map_key"] = map_key
+    m = build_map(st.session_state["map_rows"], st.session_state["map_center"], cluster_markers)
     st_data = st_folium(m, use_container_width=True, returned_objects=[])
 
 st.markdown("---")
 st.subheader("Data")
-st.dataframe(fdf, use_container_width=True)
-st.download_button("Download filtered CSV", data=fdf.to_csv(index=False).encode("utf-8"), file_name="orders_filtered.csv", mime="text/csv")
+visible = fdf.drop(columns=[c for c in fdf.columns if str(c).startswith("_")])
+# only one page of rows is sent to the browser; the downloads below still cover every filtered row
+PAGE_SIZE = 50
+pages = max(1, -(-len(visible) // PAGE_SIZE))
+s1, s2, s3 = st.columns([2,1,1])
+sort_col = s1.selectbox("Sort by", ["(board order)", *visible.columns])
+descending = s2.toggle("Descending", value=True)
+page = s3.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1)
+# sorted across every filtered row before slicing, so page 1 really is the top of the filtered set
+table = visible if sort_col == "(board order)" else visible.sort_values(sort_col, ascending=not descending, kind="stable")
+start = (int(page) - 1) * PAGE_SIZE
+st.dataframe(table.iloc[start:start + PAGE_SIZE], use_container_width=True)
+st.caption(f"Rows {min(start + 1, len(visible))}–{min(start + PAGE_SIZE, len(visible))} of {len(visible)}. "
+           "Use 'Sort by' to sort every filtered row; the table's own header sort and search only cover this page.")
+
+def to_bytes(df, write):
+    # Serialize through Arrow's vectorized writers into an in-memory buffer (CSV strings are quoted);
+    # date_parsed is exported as a plain date (no time part), as it was before it became datetime64
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if "date_parsed" in table.column_names:
+        i = table.column_names.index("date_parsed")
+        table = table.set_column(i, "date_parsed", pc.cast(table["date_parsed"], pa.date32(), safe=False))
+    buf = pa.BufferOutputStream()
+    write(table, buf)
+    return buf.getvalue().to_pybytes()
+
+d1, d2 = st.columns(2)
+d1.download_button("Download filtered CSV", data=to_bytes(visible, pacsv.write_csv), file_name="orders_filtered.csv", mime="text/csv")
+# Parquet is only written when asked for, not on every filter change
+if d2.button("Prepare Parquet download"):
+    d2.download_button("Download filtered Parquet", data=to_bytes(visible, pq.write_table), file_name="orders_filtered.parquet", mime="application/vnd.apache.parquet")
 
 st.caption("Tip: This app reads directly from Monday's GraphQL API (no intermediate spreadsheets). Refresh the page to fetch the latest data. Cache TTL is 60s by default.")